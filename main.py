@@ -1,37 +1,67 @@
 import os                       
 import pandas as pd             
 import numpy as np              
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import yaml                     
 import logging                  
+import queue
+import atexit
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime  
 import unicodedata              
+import copy
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 #crear nombre dinamico del archivo log
 fecha_hoy = datetime.today().strftime('%d-%m-%Y')
 log_filename = f'logs/etl_{fecha_hoy}.log'
 
-#configurar el logging (archivo + consola)
-logging.basicConfig(
-    filename=log_filename,
-    level=logging.DEBUG,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+#configurar el logging (archivo + consola); la escritura corre en un hilo aparte
+formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+archivo_log = logging.FileHandler(log_filename)
+archivo_log.setFormatter(formatter)
 
 console = logging.StreamHandler()
 console.setLevel(logging.DEBUG)
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 console.setFormatter(formatter)
-logging.getLogger().addHandler(console)
+
+cola_logs = queue.Queue(-1)
+logging.getLogger().setLevel(logging.DEBUG)
+logging.getLogger().addHandler(QueueHandler(cola_logs))
+listener = QueueListener(cola_logs, archivo_log, console, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+logger = logging.getLogger(__name__)
+
+#cache de configuraciones ya parseadas: ruta absoluta -> (mtime, tamaño, config)
+_cache_config = OrderedDict()
+_MAX_CACHE_CONFIG = 100
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 #funcion para leer el archivo etl_config.yaml
 def cargar_configuracion(ruta_config):
     try:
-        with open(ruta_config, 'r') as file:
-            config = yaml.safe_load(file)
-            logging.info("✅ Configuración cargada correctamente.")
-            return config
+        clave = os.path.abspath(ruta_config)
+        st = os.stat(clave)
+        cacheado = _cache_config.get(clave)
+        if cacheado is not None and cacheado[:2] == (st.st_mtime, st.st_size):
+            _cache_config.move_to_end(clave)
+            logger.info("✅ Configuración cargada desde caché.")
+            return copy.deepcopy(cacheado[2])
+        with open(clave, 'r') as file:
+            config = yaml.load(file, Loader=_YamlLoader)
+        _cache_config[clave] = (st.st_mtime, st.st_size, config)
+        _cache_config.move_to_end(clave)
+        if len(_cache_config) > _MAX_CACHE_CONFIG:
+            _cache_config.popitem(last=False)
+        logger.info("✅ Configuración cargada correctamente.")
+        return copy.deepcopy(config)
     except Exception as e:
-        logging.critical(f"❌ Error cargando configuración: {e}")
+        logger.critical(f"❌ Error cargando configuración: {e}")
         raise
 
 #funcion para remover tildes de un string
@@ -40,162 +70,248 @@ def remover_tildes(texto):
         return unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('ASCII')
     return texto
 
+#tipos conocidos de las columnas crudas de texto (evita la inferencia de pandas);
+#los numéricos no se fuerzan al leer: una celda inválida haría fallar todo el
+#archivo, así que se convierten después en tipificar_campos con errors="coerce"
+DTYPES_CRUDOS = {
+    "producto": "string",
+    "vendedor": "string",
+    "sucursal": "string",
+}
+
+FORMATO_FECHA = "%Y-%m-%d"
+
+#columnas que identifican una venta (para detectar duplicados)
+CLAVE_VENTA = ["fecha", "producto", "sucursal", "vendedor", "cantidad", "precio_unitario"]
+
+#float32 representa exactos los enteros menores a 2**24
+CANTIDAD_MAX_FLOAT32 = 2 ** 24
+
+#funcion para aplicar una transformacion de texto sobre las categorias unicas
+#(no fila por fila); las categorias que quedan iguales se fusionan
+def transformar_categorias(serie, transformar):
+    if not isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype("category")
+    nuevas = transformar(pd.Series(serie.cat.categories))
+    codigos_nuevos, unicas = pd.factorize(nuevas, sort=True)
+    # el -1 final mantiene los nulos (código -1) como nulos
+    codigos = np.append(codigos_nuevos, -1)[serie.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=unicas),
+                     index=serie.index, name=serie.name)
+
 #funcion para leer todos los archivos CSV
-def leer_archivos_csv(ruta_raw):
+def leer_archivos_csv(ruta_raw, usecols=None):
     archivos = [f for f in os.listdir(ruta_raw) if f.endswith(".csv")]
-    dataframe = []
-    for archivo in archivos:
+    dtypes = {c: t for c, t in DTYPES_CRUDOS.items() if usecols is None or c in usecols}
+
+    def leer(archivo):
         ruta = os.path.join(ruta_raw, archivo)
         try:
-            df = pd.read_csv(ruta, encoding='latin1')
-            dataframe.append(df)
-            logging.info(f"📄 Archivo cargado: {archivo}")
+            # lector multihilo de Arrow; solo se materializan las columnas pedidas
+            # y se tipifican durante el parseo (fecha con formato explícito)
+            df = pd.read_csv(ruta, encoding='latin1', engine='pyarrow', usecols=usecols, dtype=dtypes,
+                             parse_dates=["fecha"], date_format=FORMATO_FECHA)
+            logger.info(f"📄 Archivo cargado: {archivo}")
+            return df
         except Exception as e:
-            logging.error(f"⚠️ Error al leer {archivo}: {e}")
+            logger.error(f"⚠️ Error al leer {archivo}: {e}")
+            return None
+
+    # cada archivo es independiente: se leen en paralelo (el parseo libera el GIL)
+    with ThreadPoolExecutor() as ex:
+        dataframe = [df for df in ex.map(leer, archivos) if df is not None]
     if not dataframe:
-        logging.warning("⚠️ No se encontraron archivos válidos en la carpeta raw.")
+        logger.warning("⚠️ No se encontraron archivos válidos en la carpeta raw.")
     return pd.concat(dataframe, ignore_index=True) if dataframe else pd.DataFrame()
 
 def main():
-    logging.info("🚀 Inicio del proceso ETL")
+    logger.info("🚀 Inicio del proceso ETL")
     config = cargar_configuracion("etl_config.yaml")
 
-    logging.info("📥 Leyendo archivos CSV crudos...")
-    df = leer_archivos_csv(config["raw_data_path"])
+    logger.info("📥 Leyendo archivos CSV crudos (solo columnas necesarias)...")
+    df = leer_archivos_csv(config["raw_data_path"], usecols=config["columns_to_keep"])
 
     if df.empty:
-        logging.warning("⚠️ DataFrame vacío. Proceso finalizado sin datos.")
-        return
-
-    logging.info("🧹 Filtrando columnas necesarias...")
-    columnas_utiles = config["columns_to_keep"]
-    try:
-        df = df[columnas_utiles]
-        logging.info("✅ Columnas filtradas correctamente.")
-    except Exception as e:
-        logging.error(f"❌ Error al filtrar columnas: {e}")
+        logger.warning("⚠️ DataFrame vacío. Proceso finalizado sin datos.")
         return
 
     df = normalizar_texto(df, ["producto", "vendedor", "sucursal"])
     df = tipificar_campos(df)
-    df = limpiar_duplicados_y_nulos(df)
-    df = validar_reglas_negocio(df)
+    df = crear_monto_total(df)
+    df = filtrar_registros(df)
     df = estandarizar_categorias(df)
     guardar_procesado(df, config["processed_data_path"])
-    df = crear_monto_total(df)
     resumen = resumen_diario_por_sucursal(df)
     guardar_resumen_diario(resumen, config["report_path"])
 
     top_prod = top_productos(df, n=5)
     top_vend = top_vendedores(df, n=5)
 
-    logging.debug("📈 Vista resumen diario (primeras filas):\n" + resumen.head().to_string())
-    logging.debug("🥇 Top productos:\n" + top_prod.to_string(index=False))
-    logging.debug("🧑‍💼 Top vendedores:\n" + top_vend.to_string(index=False))
-    logging.debug("🔍 Vista previa de los datos:")
-    logging.debug(f"\n{df.head()}")
-    logging.info("✅ ETL finalizado correctamente. Próxima fase: limpieza.")
+    # to_string() es caro: solo se arma el texto si DEBUG está activo
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📈 Vista resumen diario (primeras filas):\n" + resumen.head().to_string())
+        logger.debug("🥇 Top productos:\n" + top_prod.to_string(index=False))
+        logger.debug("🧑‍💼 Top vendedores:\n" + top_vend.to_string(index=False))
+        logger.debug("🔍 Vista previa de los datos:")
+        logger.debug(f"\n{df.head()}")
+    logger.info("✅ ETL finalizado correctamente. Próxima fase: limpieza.")
 
 def normalizar_texto(df, cols_texto):
     for c in cols_texto:
         if c in df.columns:
-            df[c] = df[c].astype(str).str.strip()
-            df[c] = df[c].replace({"None": np.nan, "nan": np.nan, "Nan": np.nan})
-            df[c] = df[c].apply(remover_tildes)  # Aplicar normalización
-    logging.info("🧽 Normalización básica de texto completada.")
+            # se trabaja sobre las categorías únicas (remover_tildes queda para escalares)
+            df[c] = transformar_categorias(df[c], _limpiar_texto)
+    logger.info("🧽 Normalización básica de texto completada.")
     return df
 
+def _limpiar_texto(s):
+    s = s.astype("string").str.strip()
+    s = s.mask(s.isin(["None", "nan", "Nan"]))
+    return s.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+
 def tipificar_campos(df):
-    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
-    df["cantidad"] = pd.to_numeric(df["cantidad"], errors="coerce")
-    df["precio_unitario"] = pd.to_numeric(df["precio_unitario"], errors="coerce")
-    logging.info("🧱 Tipificación: fechas y numéricos aplicados.")
+    # la fecha llega tipada salvo que no respete el formato; los numéricos se
+    # convierten acá para que una celda inválida quede como NaN y no tire el archivo
+    if not pd.api.types.is_datetime64_any_dtype(df["fecha"]):
+        df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce")
+    # el precio queda en float64 para no alterar importes con decimales
+    for c in ("cantidad", "precio_unitario"):
+        if df[c].dtype != np.float64:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    # cantidad solo se reduce a float32 si son unidades enteras (< 2**24, exactas en
+    # float32); con fracciones se mantiene float64 para no alterar montos ni duplicados
+    cantidad = df["cantidad"].to_numpy()
+    validas = cantidad[~np.isnan(cantidad)]
+    if ((validas % 1 == 0) & (np.abs(validas) < CANTIDAD_MAX_FLOAT32)).all():
+        df["cantidad"] = df["cantidad"].astype("float32")
+    else:
+        logger.warning("⚠️ Hay cantidades fraccionarias o muy grandes: cantidad se mantiene en float64.")
+    logger.info("🧱 Tipificación: fechas y numéricos aplicados.")
     return df
 
-def limpiar_duplicados_y_nulos(df):
-    antes = len(df)
-    df = df.drop_duplicates()
-    dup = antes - len(df)
+def mascara_duplicados_y_nulos(df):
+    # solo la clave de negocio (ya con columnas categóricas), no la fila completa
+    unicos = ~df.duplicated(subset=[c for c in CLAVE_VENTA if c in df.columns], keep="first").to_numpy()
+    dup = int((~unicos).sum())
     if dup > 0:
-        logging.warning(f"♻️ Duplicados eliminados: {dup}")
+        logger.warning(f"♻️ Duplicados eliminados: {dup}")
     criticos = ["fecha", "producto", "cantidad", "precio_unitario"]
-    nulos_antes = df[criticos].isna().sum().sum()
-    df = df.dropna(subset=criticos)
-    nulos_despues = df[criticos].isna().sum().sum()
-    if nulos_antes > nulos_despues:
-        logging.warning(f"🚫 Filas eliminadas por nulos críticos: {nulos_antes - nulos_despues}")
-    return df
+    completos = df[criticos].notna().all(axis=1).to_numpy()
+    eliminadas = int((unicos & ~completos).sum())
+    if eliminadas > 0:
+        logger.warning(f"🚫 Filas eliminadas por nulos críticos: {eliminadas}")
+    return unicos & completos
 
-def validar_reglas_negocio(df, ruta_rechazos="data/processed/rechazados.csv"):
-    hoy = pd.to_datetime(datetime.today().date())
-    mask_futuras = df["fecha"] > hoy
-    mask_precio_invalido = (df["precio_unitario"] <= 0) | (df["precio_unitario"].isna())
-    mask_cantidad_invalida = (df["cantidad"] <= 0) | (df["cantidad"].isna())
-    mask_fecha_invalida = df["fecha"].isna()
-    rechazados = df[mask_futuras | mask_precio_invalido | mask_cantidad_invalida | mask_fecha_invalida].copy()
-    df_valido = df.drop(rechazados.index)
+def mascara_reglas_negocio(df):
+    hoy = np.datetime64(datetime.today().date())
+    fecha = df["fecha"].to_numpy()
+    precio = df["precio_unitario"].to_numpy()
+    cantidad = df["cantidad"].to_numpy()
+    # una sola expresión sobre los arrays; los NaN/NaT no pasan las comparaciones ">"
+    return (fecha > hoy) | np.isnat(fecha) | ~(precio > 0) | ~(cantidad > 0)
+
+#duplicados, nulos y reglas de negocio se combinan en una máscara y el frame
+#se recorta una sola vez
+def filtrar_registros(df, ruta_rechazos="data/processed/rechazados.csv"):
+    conservar = mascara_duplicados_y_nulos(df)
+    invalidos = mascara_reglas_negocio(df)
+    # los rechazos mantienen las columnas de origen (sin monto_total)
+    rechazados = df.loc[conservar & invalidos, [c for c in df.columns if c != "monto_total"]]
+    df_valido = df[conservar & ~invalidos].reset_index(drop=True)
     if not rechazados.empty:
         os.makedirs(os.path.dirname(ruta_rechazos), exist_ok=True)
-        modo = "a" if os.path.exists(ruta_rechazos) else "w"
-        encabezado = not os.path.exists(ruta_rechazos)
-        rechazados.to_csv(ruta_rechazos, index=False, mode=modo, header=encabezado)
-        logging.error(f"🧯 Registros rechazados por reglas de negocio: {len(rechazados)}. Guardados en {ruta_rechazos}")
-    logging.info(f"✅ Registros válidos tras reglas de negocio: {len(df_valido)}")
+        # un solo stat: "a" crea el archivo si no existe; el encabezado solo va si está vacío
+        try:
+            existe = os.stat(ruta_rechazos).st_size > 0
+        except FileNotFoundError:
+            existe = False
+        rechazados.to_csv(ruta_rechazos, index=False, mode="a", header=not existe)
+        logger.error(f"🧯 Registros rechazados por reglas de negocio: {len(rechazados)}. Guardados en {ruta_rechazos}")
+    logger.info(f"✅ Registros válidos tras reglas de negocio: {len(df_valido)}")
     return df_valido
 
 def estandarizar_categorias(df):
     if "sucursal" in df.columns:
-        df["sucursal"] = df["sucursal"].str.title()
+        df["sucursal"] = transformar_categorias(df["sucursal"], lambda s: s.str.title())
     if "producto" in df.columns:
-        df["producto"] = df["producto"].str.title()
+        df["producto"] = transformar_categorias(df["producto"], lambda s: s.str.title())
     if "vendedor" in df.columns:
-        df["vendedor"] = df["vendedor"].str.title()
-    logging.info("🎛️ Estandarización de categorías aplicada.")
+        df["vendedor"] = transformar_categorias(df["vendedor"], lambda s: s.str.title())
+    logger.info("🎛️ Estandarización de categorías aplicada.")
     return df
 
 def guardar_procesado(df, ruta_processed):
     os.makedirs(ruta_processed, exist_ok=True)
-    nombre = f"ventas_limpias_{datetime.today().strftime('%d-%m-%Y')}.csv"
+    nombre = f"ventas_limpias_{datetime.today().strftime('%d-%m-%Y')}.parquet"
     destino = os.path.join(ruta_processed, nombre)
-    df.to_csv(destino, index=False)
-    logging.info(f"💾 Datos limpios guardados en: {destino}")
+    # parquet columnar: conserva los tipos (incluidas las categorías) y pesa mucho menos
+    # la tabla Arrow se arma solo con las columnas de origen (sin copiar el frame)
+    columnas = [c for c in df.columns if c != "monto_total"]
+    tabla = pa.Table.from_pandas(df, columns=columnas, preserve_index=False)
+    pq.write_table(tabla, destino, compression="zstd", use_dictionary=True)
+    logger.info(f"💾 Datos limpios guardados en: {destino}")
 
 def crear_monto_total(df):
-    df = df.copy()
-    df["monto_total"] = df["cantidad"] * df["precio_unitario"]
-    logging.info("➕ Columna monto_total creada.")
+    # se calcula antes del filtrado, sobre los arrays contiguos; al recortar el frame
+    # queda junto a las demás columnas (float64, igual que el precio)
+    df["monto_total"] = df["cantidad"].to_numpy(dtype="float64") * df["precio_unitario"].to_numpy()
+    logger.info("➕ Columna monto_total creada.")
     return df
 
 def resumen_diario_por_sucursal(df):
-    base = df.copy()
-    base["fecha"] = pd.to_datetime(base["fecha"]).dt.date
-    g = base.groupby(["fecha", "sucursal"], dropna=False).agg(
-        ventas_totales=("monto_total", "sum"),
-        unidades=("cantidad", "sum"),
-        tickets=("producto", "count")
-    ).reset_index()
+    # agregación por códigos: se factorizan las claves una vez y se suma con bincount
+    # día como datetime64[D]: clave entera de 8 bytes, sin objetos date de Python
+    dia = df["fecha"].to_numpy().astype("datetime64[D]")
+    cod_fecha, fechas = pd.factorize(dia, sort=True, use_na_sentinel=False)
+    cod_suc, sucursales = pd.factorize(df["sucursal"], sort=True, use_na_sentinel=False)
+    n_suc = max(len(sucursales), 1)
+    grupo, claves = pd.factorize(cod_fecha.astype(np.int64) * n_suc + cod_suc, sort=True)
+    n = len(claves)
+    monto = np.nan_to_num(df["monto_total"].to_numpy(dtype="float64"))
+    cantidad = np.nan_to_num(df["cantidad"].to_numpy(dtype="float64"))
+    con_producto = df["producto"].notna().to_numpy()
+    g = pd.DataFrame({
+        "fecha": np.asarray(fechas.take(claves // n_suc)),
+        "sucursal": sucursales.take(claves % n_suc),
+        "ventas_totales": np.bincount(grupo, weights=monto, minlength=n),
+        "unidades": np.bincount(grupo, weights=cantidad, minlength=n),
+        "tickets": np.bincount(grupo[con_producto], minlength=n),
+    })
     g["ticket_promedio"] = (g["ventas_totales"] / g["tickets"]).replace([np.inf, -np.inf], np.nan)
-    logging.info("📊 Resumen diario por sucursal generado.")
+    logger.info("📊 Resumen diario por sucursal generado.")
     return g
 
 def top_productos(df, n=5):
-    g = (df.groupby("producto")["monto_total"].sum().sort_values(ascending=False).head(n).reset_index())
-    logging.info(f"🏆 Top {n} productos calculado.")
+    g = (df.groupby("producto", sort=False, observed=True)["monto_total"].sum().nlargest(n).reset_index())
+    logger.info(f"🏆 Top {n} productos calculado.")
     return g
 
 def top_vendedores(df, n=5):
-    df2 = df.copy()
-    df2["vendedor"] = df2["vendedor"].fillna("Sin Vendedor")
-    g = (df2.groupby("vendedor")["monto_total"].sum().sort_values().head(n).reset_index())
-    logging.info(f"🧑‍💼 Top {n} vendedores calculado.")
+    vendedor = df["vendedor"]
+    if isinstance(vendedor.dtype, pd.CategoricalDtype) and "Sin Vendedor" not in vendedor.cat.categories:
+        vendedor = vendedor.cat.add_categories("Sin Vendedor")
+    vendedor = vendedor.fillna("Sin Vendedor")
+    g = (df["monto_total"].groupby(vendedor, sort=False, observed=True).sum().nlargest(n).reset_index())
+    logger.info(f"🧑‍💼 Top {n} vendedores calculado.")
     return g
 
 def guardar_resumen_diario(df_resumen, report_path):
-    os.makedirs(os.path.dirname(report_path), exist_ok=True)
-    modo = "a" if os.path.exists(report_path) else "w"
-    header = not os.path.exists(report_path)
-    df_resumen.to_csv(report_path, index=False, mode=modo, header=header)
-    logging.info(f"📤 Resumen diario anexado en: {report_path}")
+    os.makedirs(report_path, exist_ok=True)
+    tabla = pa.Table.from_pandas(df_resumen, preserve_index=False)
+    i = tabla.schema.get_field_index("fecha")
+    tabla = tabla.set_column(i, "fecha", tabla["fecha"].cast(pa.date32()))
+    # dataset particionado por día (fecha=AAAA-MM-DD); el resumen cubre todos los días
+    # leídos, así que los límites de particiones/archivos abiertos se ajustan a esa cantidad
+    dias = max(len(tabla["fecha"].unique()), 1024)
+    # delete_matching borra cada partición escrita antes de reemplazarla
+    ds.write_dataset(
+        tabla, report_path, format="parquet",
+        partitioning=["fecha"], partitioning_flavor="hive",
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+        max_partitions=dias, max_open_files=dias,
+        existing_data_behavior="delete_matching",
+    )
+    logger.info(f"📤 Resumen diario guardado en: {report_path}")
 
 if __name__ == "__main__":
     main()